@@ -5,3 +5,4 @@ from pixelcnn.pixelcnn import PixelCNN
 from pixelcnn.pixelcnn import ConditionalPixelCNN
 from pixelcnn.pixelcnn_plus_plus import PixelCNNPlusPlus
 from pixelcnn.pixelcnn_plus_plus import ConditionalPixelCNNPlusPlus
+from pixelcnn.sampling import PixelCNNSampler
@@ -1,8 +1,8 @@
 """Author: Brandon Trabucco, Copyright 2020, MIT License"""
 
 
-from pixelcnn.ops import down_shifted_conv2d
-from pixelcnn.ops import concat_elu
+from pixelcnn.ops import concat_elu_down_shifted_conv2d
+from pixelcnn.ops import ConcatEluConv2D
 from tensorflow.keras import layers
 import tensorflow as tf
 
@@ -11,10 +11,10 @@ def gated_resnet(
         x,
         a=None,
         h=None,
-        conv2d=down_shifted_conv2d,
-        nonlinearity=concat_elu,
+        conv2d=concat_elu_down_shifted_conv2d,
         kernel_size=(2, 3),
         dropout_rate=0.1,
+        name=None,
         **kwargs
 ):
     """Build a single Gated Masked Conv2D module.
@@ -27,46 +27,50 @@ def gated_resnet(
         that conditions image generation
 
     - conv2d: The type of convolution operation to use in this module,
-        must be Keras compatible.
-    - nonlinearity: The type of nonlinearity to use in this module,
-        must be Keras compatible.
+        which applies the concatenated ELU nonlinearity to its inputs
+        and must be Keras compatible.
     - kernel_size: An integer or tuple/list of 2 integers, specifying
         the height and width of the 2D convolution window. Can be a single
         integer to specify the same value for all spatial dimensions.
 
     - dropout_rate: Float between 0 and 1. Fraction of the input
         units to drop.
+    - name: String, the prefix for the names of the layers in
+        this module.
 
     Returns:
     - out_x: a 4-Tensor with shape [batch_dim, height, width, channels]
     """
     filters = int(x.shape[-1])
 
-    c = nonlinearity(x)
-    c = conv2d(c, filters, kernel_size, **kwargs)
+    def scoped(suffix):
+        return None if name is None else '{}_{}'.format(name, suffix)
+
+    c = conv2d(x, filters, kernel_size, name=scoped('conv_1'), **kwargs)
 
     if a is not None:
-        a = nonlinearity(a)
-        c = layers.add([c, layers.Conv2D(
+        c = layers.add([c, ConcatEluConv2D(
             filters,
             1,
-            padding='valid',
-            data_format='channels_last',
-            **kwargs)(a)])
+            conv_kwargs=kwargs,
+            name=scoped('conv_a'))(a)])
 
-    c = nonlinearity(c)
-    c = layers.SpatialDropout2D(
-        dropout_rate, data_format='channels_last')(c)
-    c = conv2d(c, filters * 2, kernel_size, **kwargs)
+    # the value and the gate share one conv with twice the filters
+    # that is split below, and so does the projection of h
+    c = conv2d(
+        c,
+        filters * 2,
+        kernel_size,
+        dropout_rate=dropout_rate,
+        name=scoped('conv_2'),
+        **kwargs)
 
     if h is not None:
-        h = nonlinearity(h)
-        c = layers.add([c, layers.Conv2D(
+        c = layers.add([c, ConcatEluConv2D(
             filters * 2,
             1,
-            padding='valid',
-            data_format='channels_last',
-            **kwargs)(h)])
+            conv_kwargs=kwargs,
+            name=scoped('conv_h'))(h)])
 
     def split_backend(z):
         return tf.split(z, 2, axis=3)
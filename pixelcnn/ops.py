@@ -3,6 +3,7 @@
 
 from tensorflow.keras import layers
 import tensorflow as tf
+import numpy as np
 
 
 def concat_elu_backend(x):
@@ -29,6 +30,327 @@ def concat_elu(x):
     return layers.Lambda(concat_elu_backend)(x)
 
 
+@tf.keras.utils.register_keras_serializable(package='pixelcnn')
+class OnesPad(layers.Layer):
+    """Append a constant channel of ones, which lets the following
+    shifted convolutions detect the zero padded image boundary."""
+
+    def call(self, x):
+        """Append a channel of ones to the input.
+
+        Args:
+        - x: a 4-Tensor with shape [batch_dim, height, width, channels]
+
+        Returns:
+        - padded_x: a 4-Tensor with shape [batch_dim, height, width,
+            channels + 1]
+        """
+        return tf.concat([x, tf.ones_like(x[..., :1])], -1)
+
+    def compute_output_shape(self, input_shape):
+        """Compute the static output shape of this layer.
+
+        Args:
+        - input_shape: a TensorShape with shape [batch_dim, height,
+            width, channels]
+
+        Returns:
+        - output_shape: a TensorShape with shape [batch_dim, height,
+            width, channels + 1]
+        """
+        input_shape = tf.TensorShape(input_shape)
+        channels = input_shape[-1]
+        return input_shape[:-1].concatenate([
+            None if channels is None else channels + 1])
+
+
+@tf.keras.utils.register_keras_serializable(package='pixelcnn')
+class EmbeddingWithBias(layers.Layer):
+    """Embed discrete pixels and append a constant channel of ones with
+    a single lookup into a table whose last column is one."""
+
+    def __init__(
+            self,
+            input_dim,
+            output_dim,
+            embeddings_initializer='uniform',
+            **kwargs
+    ):
+        """Create an embedding layer with a constant ones channel.
+
+        Args:
+        - input_dim: Integer, the cardinality of the discrete pixels.
+        - output_dim: Integer, the dimension of the learned embedding,
+            which is followed by one constant channel.
+        - embeddings_initializer: the initializer for the embeddings.
+        """
+        # pixel ids are not cast to the compute dtype, bfloat16 and
+        # float16 cannot hold every id below 1000 exactly
+        kwargs['autocast'] = False
+        super(EmbeddingWithBias, self).__init__(**kwargs)
+        self.input_dim = input_dim
+        self.output_dim = output_dim
+        self.embeddings_initializer = tf.keras.initializers.get(
+            embeddings_initializer)
+
+    def build(self, input_shape):
+        """Create the embedding table.
+
+        Args:
+        - input_shape: a TensorShape with shape [batch_dim, height, width]
+        """
+        self.embeddings = self.add_weight(
+            name='embeddings',
+            shape=[self.input_dim, self.output_dim],
+            initializer=self.embeddings_initializer)
+        super(EmbeddingWithBias, self).build(input_shape)
+
+    def call(self, x):
+        """Look up the embeddings of the pixels.
+
+        Args:
+        - x: a 3-Tensor with shape [batch_dim, height, width]
+
+        Returns:
+        - embeddings: a 4-Tensor with shape [batch_dim, height, width,
+            output_dim + 1]
+        """
+        embeddings = tf.cast(self.embeddings, self.compute_dtype)
+        table = tf.concat([embeddings, tf.ones([
+            self.input_dim, 1], dtype=embeddings.dtype)], -1)
+        return tf.gather(table, tf.cast(x, tf.int32))
+
+    def compute_output_shape(self, input_shape):
+        """Compute the static output shape of this layer.
+
+        Args:
+        - input_shape: a TensorShape with shape [batch_dim, height, width]
+
+        Returns:
+        - output_shape: a TensorShape with shape [batch_dim, height,
+            width, output_dim + 1]
+        """
+        return tf.TensorShape(input_shape).concatenate([
+            self.output_dim + 1])
+
+    def get_config(self):
+        """Serialize the arguments of this layer.
+
+        Returns:
+        - config: a dict of arguments that recreate this layer
+        """
+        config = super(EmbeddingWithBias, self).get_config()
+        config.update(
+            input_dim=self.input_dim,
+            output_dim=self.output_dim,
+            embeddings_initializer=tf.keras.initializers.serialize(
+                self.embeddings_initializer))
+        return config
+
+
+@tf.keras.utils.register_keras_serializable(package='pixelcnn')
+class ConcatEluConv2D(layers.Layer):
+    """Concatenated ELU activation followed by a shifted Conv2D, which
+    splits the kernel along its input channels and convolves elu(x) and
+    elu(-x) separately, so the doubled activation is never stored."""
+
+    def __init__(
+            self,
+            filters,
+            kernel_size,
+            shift=None,
+            dropout_rate=0.0,
+            conv_kwargs=None,
+            **kwargs
+    ):
+        """Create a fused concatenated ELU and Conv2D layer.
+
+        Args:
+        - filters: Integer, the dimensionality of the output space
+            (i.e. the number of output filters in the convolution).
+        - kernel_size: An integer or tuple/list of 2 integers, specifying
+            the height and width of the 2D convolution window. Can be a
+            single integer to specify the same value for all spatial
+            dimensions.
+        - shift: one of None, 'down', or 'down_right' that specifies
+            how the input is padded before the convolution.
+
+        - dropout_rate: Float between 0 and 1. Fraction of the
+            activated channels to drop.
+        - conv_kwargs: a dict of keyword arguments for the Conv2D
+            that holds the kernel and bias.
+        """
+        super(ConcatEluConv2D, self).__init__(**kwargs)
+        self.filters = filters
+        self.kernel_size = kernel_size
+        self.shift = shift
+        self.dropout_rate = dropout_rate
+        self.conv_kwargs = dict(conv_kwargs or {})
+
+        self.conv = layers.Conv2D(
+            filters,
+            kernel_size,
+            padding='valid',
+            data_format='channels_last',
+            **self.conv_kwargs)
+
+        dy, dx = self.conv.kernel_size
+        if shift == 'down':
+            self.paddings = [[0, 0], [dy - 1, 0], [int((
+                dx - 1) / 2), int((dx - 1) / 2)], [0, 0]]
+        elif shift == 'down_right':
+            self.paddings = [[0, 0], [dy - 1, 0], [dx - 1, 0], [0, 0]]
+        else:
+            self.paddings = None
+
+    def build(self, input_shape):
+        """Create the kernel for the doubled input channels.
+
+        Args:
+        - input_shape: a TensorShape with shape [batch_dim, height,
+            width, channels]
+        """
+        input_shape = tf.TensorShape(input_shape)
+        self.conv.build(input_shape[:-1].concatenate([
+            input_shape[-1] * 2]))
+        super(ConcatEluConv2D, self).build(input_shape)
+
+    def call(self, x, training=None):
+        """Apply the concatenated ELU and the Conv2D.
+
+        Args:
+        - x: a 4-Tensor with shape [batch_dim, height, width, channels]
+        - training: a boolean that indicates whether to apply dropout.
+
+        Returns:
+        - out_x: a 4-Tensor with shape [batch_dim, height, width, filters]
+        """
+        # elu(0) is 0 so padding before the activation is the same
+        # as padding the concatenated activation
+        if self.paddings is not None:
+            x = tf.pad(x, self.paddings)
+
+        positive_x = tf.nn.elu(x)
+        negative_x = tf.nn.elu(-x)
+
+        # drop whole channels like SpatialDropout2D, and only build the
+        # dropout ops at all when training is a python True
+        if training and self.dropout_rate > 0:
+            noise_shape = tf.concat([
+                tf.shape(x)[:1], [1, 1], tf.shape(x)[3:]], 0)
+            positive_x = tf.nn.dropout(
+                positive_x, self.dropout_rate, noise_shape=noise_shape)
+            negative_x = tf.nn.dropout(
+                negative_x, self.dropout_rate, noise_shape=noise_shape)
+
+        kernel = tf.cast(self.conv.kernel, x.dtype)
+        positive_kernel, negative_kernel = tf.split(kernel, 2, axis=2)
+
+        out_x = tf.nn.conv2d(
+            positive_x,
+            positive_kernel,
+            self.conv.strides,
+            'VALID',
+            dilations=self.conv.dilation_rate) + tf.nn.conv2d(
+            negative_x,
+            negative_kernel,
+            self.conv.strides,
+            'VALID',
+            dilations=self.conv.dilation_rate)
+
+        if self.conv.use_bias:
+            out_x = tf.nn.bias_add(
+                out_x, tf.cast(self.conv.bias, x.dtype))
+        if self.conv.activation is not None:
+            out_x = self.conv.activation(out_x)
+        return out_x
+
+    def get_config(self):
+        """Serialize the arguments of this layer.
+
+        Returns:
+        - config: a dict of arguments that recreate this layer
+        """
+        conv_kwargs = self.conv.get_config()
+        for key in ['name', 'trainable', 'dtype', 'filters',
+                    'kernel_size', 'padding', 'data_format']:
+            conv_kwargs.pop(key, None)
+
+        config = super(ConcatEluConv2D, self).get_config()
+        config.update(
+            filters=self.filters,
+            kernel_size=self.kernel_size,
+            shift=self.shift,
+            dropout_rate=self.dropout_rate,
+            conv_kwargs=conv_kwargs)
+        return config
+
+
+@tf.keras.utils.register_keras_serializable(package='pixelcnn')
+class MaskedConv2D(layers.Conv2D):
+    """Conv2D with valid padding whose kernel is multiplied by a fixed
+    binary mask, which lets several smaller kernels share one conv."""
+
+    def __init__(
+            self,
+            filters,
+            kernel_size,
+            kernel_mask,
+            **kwargs
+    ):
+        """Create a masked Conv2D layer.
+
+        Args:
+        - filters: Integer, the dimensionality of the output space
+            (i.e. the number of output filters in the convolution).
+        - kernel_size: An integer or tuple/list of 2 integers, specifying
+            the height and width of the 2D convolution window. Can be a
+            single integer to specify the same value for all spatial
+            dimensions.
+        - kernel_mask: a nested list with shape [kernel_height,
+            kernel_width, filters] of zeros and ones that is
+            broadcast over the input channels of the kernel.
+        """
+        super(MaskedConv2D, self).__init__(
+            filters, kernel_size, **kwargs)
+        self.kernel_mask = np.array(kernel_mask, dtype=np.float32)
+
+    def call(self, x):
+        """Apply the masked Conv2D.
+
+        Args:
+        - x: a 4-Tensor with shape [batch_dim, height, width, channels]
+
+        Returns:
+        - out_x: a 4-Tensor with shape [batch_dim, height, width, filters]
+        """
+        kernel = tf.cast(self.kernel, x.dtype) * tf.cast(
+            self.kernel_mask[:, :, np.newaxis, :], x.dtype)
+
+        out_x = tf.nn.conv2d(
+            x,
+            kernel,
+            self.strides,
+            'VALID',
+            dilations=self.dilation_rate)
+
+        if self.use_bias:
+            out_x = tf.nn.bias_add(out_x, tf.cast(self.bias, x.dtype))
+        if self.activation is not None:
+            out_x = self.activation(out_x)
+        return out_x
+
+    def get_config(self):
+        """Serialize the arguments of this layer.
+
+        Returns:
+        - config: a dict of arguments that recreate this layer
+        """
+        config = super(MaskedConv2D, self).get_config()
+        config.update(kernel_mask=self.kernel_mask.tolist())
+        return config
+
+
 def down_shift_backend(x):
     """Down shift the image, an alternative to masked convolutions.
 
@@ -108,6 +430,8 @@ def down_shifted_conv2d(
     dy = kernel_size if isinstance(kernel_size, int) else kernel_size[0]
     dx = kernel_size if isinstance(kernel_size, int) else kernel_size[1]
 
+    # causality comes from this padding and the stream shifts rather
+    # than from a masked kernel, so every kernel tap does useful work
     def padding_backend(z):
         return tf.pad(
             z, [[0, 0], [dy - 1, 0], [int((
@@ -123,6 +447,166 @@ def down_shifted_conv2d(
         **kwargs)(x)
 
 
+def initial_shifted_conv2d(
+        x,
+        filters,
+        **kwargs
+):
+    """Start the top and top left streams with a single Conv2D.
+
+    The (1, 3) down shifted kernel of the top left stream is the last
+    row of a (2, 3) down shifted kernel, and its (2, 1) down and right
+    shifted kernel is the center column, so one (2, 3) conv with the
+    rest of those filters masked to zero computes every initial stream
+    from one read of the input.
+
+    Args:
+    - x: a 4-Tensor with shape [batch_dim, height, width, channels]
+
+    - filters: Integer, the dimensionality of the output space
+        (i.e. the number of output filters in the convolution).
+
+    Returns:
+    - top: a 4-Tensor with shape [batch_dim, height, width, filters]
+    - top_left: a 4-Tensor with shape [batch_dim, height, width, filters]
+    """
+    kernel_mask = np.ones([2, 3, filters * 3], dtype=np.float32)
+    kernel_mask[0, :, filters:filters * 2] = 0.0
+    kernel_mask[:, 0, filters * 2:] = 0.0
+    kernel_mask[:, 2, filters * 2:] = 0.0
+
+    def padding_backend(z):
+        return tf.pad(z, [[0, 0], [1, 0], [1, 1], [0, 0]])
+
+    x = layers.Lambda(padding_backend)(x)
+
+    x = MaskedConv2D(
+        filters * 3,
+        (2, 3),
+        kernel_mask=kernel_mask,
+        padding='valid',
+        data_format='channels_last',
+        **kwargs)(x)
+
+    def split_backend(z):
+        return tf.split(z, 3, axis=3)
+
+    top, top_left_a, top_left_b = layers.Lambda(split_backend)(x)
+    return down_shift(top), layers.add([
+        down_shift(top_left_a), right_shift(top_left_b)])
+
+
+def down_shifted_sepconv2d(
+        x,
+        filters,
+        kernel_size,
+        **kwargs
+):
+    """Perform a down shifted depthwise separable Conv2D.
+
+    Args:
+    - x: a 4-Tensor with shape [batch_dim, height, width, channels]
+
+    - filters: Integer, the dimensionality of the output space
+        (i.e. the number of output filters in the convolution).
+    - kernel_size: An integer or tuple/list of 2 integers, specifying
+        the height and width of the 2D convolution window. Can be a single
+        integer to specify the same value for all spatial dimensions.
+
+    Returns:
+    - out_x: a 4-Tensor with shape [batch_dim, height, width, channels]
+    """
+    dy = kernel_size if isinstance(kernel_size, int) else kernel_size[0]
+    dx = kernel_size if isinstance(kernel_size, int) else kernel_size[1]
+
+    def padding_backend(z):
+        return tf.pad(
+            z, [[0, 0], [dy - 1, 0], [int((
+                dx - 1) / 2), int((dx - 1) / 2)], [0, 0]])
+
+    x = layers.Lambda(padding_backend)(x)
+
+    x = layers.DepthwiseConv2D(
+        kernel_size,
+        padding='valid',
+        use_bias=False,
+        data_format='channels_last')(x)
+
+    return layers.Conv2D(
+        filters,
+        1,
+        padding='valid',
+        data_format='channels_last',
+        **kwargs)(x)
+
+
+def concat_elu_down_shifted_conv2d(
+        x,
+        filters,
+        kernel_size,
+        dropout_rate=0.0,
+        name=None,
+        **kwargs
+):
+    """Perform a concatenated ELU followed by a down shifted Conv2D.
+
+    Args:
+    - x: a 4-Tensor with shape [batch_dim, height, width, channels]
+
+    - filters: Integer, the dimensionality of the output space
+        (i.e. the number of output filters in the convolution).
+    - kernel_size: An integer or tuple/list of 2 integers, specifying
+        the height and width of the 2D convolution window. Can be a single
+        integer to specify the same value for all spatial dimensions.
+
+    - dropout_rate: Float between 0 and 1. Fraction of the
+        activated channels to drop.
+    - name: String, the name of the fused layer.
+
+    Returns:
+    - out_x: a 4-Tensor with shape [batch_dim, height, width, channels]
+    """
+    return ConcatEluConv2D(
+        filters,
+        kernel_size,
+        shift='down',
+        dropout_rate=dropout_rate,
+        name=name,
+        conv_kwargs=kwargs)(x)
+
+
+def concat_elu_down_shifted_sepconv2d(
+        x,
+        filters,
+        kernel_size,
+        dropout_rate=0.0,
+        **kwargs
+):
+    """Perform a concatenated ELU followed by a down shifted
+    depthwise separable Conv2D.
+
+    Args:
+    - x: a 4-Tensor with shape [batch_dim, height, width, channels]
+
+    - filters: Integer, the dimensionality of the output space
+        (i.e. the number of output filters in the convolution).
+    - kernel_size: An integer or tuple/list of 2 integers, specifying
+        the height and width of the 2D convolution window. Can be a single
+        integer to specify the same value for all spatial dimensions.
+
+    - dropout_rate: Float between 0 and 1. Fraction of the
+        activated channels to drop.
+
+    Returns:
+    - out_x: a 4-Tensor with shape [batch_dim, height, width, channels]
+    """
+    x = concat_elu(x)
+    if dropout_rate > 0:
+        x = layers.SpatialDropout2D(
+            dropout_rate, data_format='channels_last')(x)
+    return down_shifted_sepconv2d(x, filters, kernel_size, **kwargs)
+
+
 def down_shifted_conv2d_transpose(
         x,
         filters,
@@ -198,6 +682,117 @@ def down_right_shifted_conv2d(
         **kwargs)(x)
 
 
+def down_right_shifted_sepconv2d(
+        x,
+        filters,
+        kernel_size,
+        **kwargs
+):
+    """Perform a down and right shifted depthwise separable Conv2D.
+
+    Args:
+    - x: a 4-Tensor with shape [batch_dim, height, width, channels]
+
+    - filters: Integer, the dimensionality of the output space
+        (i.e. the number of output filters in the convolution).
+    - kernel_size: An integer or tuple/list of 2 integers, specifying
+        the height and width of the 2D convolution window. Can be a single
+        integer to specify the same value for all spatial dimensions.
+
+    Returns:
+    - out_x: a 4-Tensor with shape [batch_dim, height, width, channels]
+    """
+    dy = kernel_size if isinstance(kernel_size, int) else kernel_size[0]
+    dx = kernel_size if isinstance(kernel_size, int) else kernel_size[1]
+
+    def padding_backend(z):
+        return tf.pad(
+            z, [[0, 0], [dy - 1, 0], [dx - 1, 0], [0, 0]])
+
+    x = layers.Lambda(padding_backend)(x)
+
+    x = layers.DepthwiseConv2D(
+        kernel_size,
+        padding='valid',
+        use_bias=False,
+        data_format='channels_last')(x)
+
+    return layers.Conv2D(
+        filters,
+        1,
+        padding='valid',
+        data_format='channels_last',
+        **kwargs)(x)
+
+
+def concat_elu_down_right_shifted_conv2d(
+        x,
+        filters,
+        kernel_size,
+        dropout_rate=0.0,
+        name=None,
+        **kwargs
+):
+    """Perform a concatenated ELU followed by a down and right
+    shifted Conv2D.
+
+    Args:
+    - x: a 4-Tensor with shape [batch_dim, height, width, channels]
+
+    - filters: Integer, the dimensionality of the output space
+        (i.e. the number of output filters in the convolution).
+    - kernel_size: An integer or tuple/list of 2 integers, specifying
+        the height and width of the 2D convolution window. Can be a single
+        integer to specify the same value for all spatial dimensions.
+
+    - dropout_rate: Float between 0 and 1. Fraction of the
+        activated channels to drop.
+    - name: String, the name of the fused layer.
+
+    Returns:
+    - out_x: a 4-Tensor with shape [batch_dim, height, width, channels]
+    """
+    return ConcatEluConv2D(
+        filters,
+        kernel_size,
+        shift='down_right',
+        dropout_rate=dropout_rate,
+        name=name,
+        conv_kwargs=kwargs)(x)
+
+
+def concat_elu_down_right_shifted_sepconv2d(
+        x,
+        filters,
+        kernel_size,
+        dropout_rate=0.0,
+        **kwargs
+):
+    """Perform a concatenated ELU followed by a down and right
+    shifted depthwise separable Conv2D.
+
+    Args:
+    - x: a 4-Tensor with shape [batch_dim, height, width, channels]
+
+    - filters: Integer, the dimensionality of the output space
+        (i.e. the number of output filters in the convolution).
+    - kernel_size: An integer or tuple/list of 2 integers, specifying
+        the height and width of the 2D convolution window. Can be a single
+        integer to specify the same value for all spatial dimensions.
+
+    - dropout_rate: Float between 0 and 1. Fraction of the
+        activated channels to drop.
+
+    Returns:
+    - out_x: a 4-Tensor with shape [batch_dim, height, width, channels]
+    """
+    x = concat_elu(x)
+    if dropout_rate > 0:
+        x = layers.SpatialDropout2D(
+            dropout_rate, data_format='channels_last')(x)
+    return down_right_shifted_sepconv2d(x, filters, kernel_size, **kwargs)
+
+
 def down_right_shifted_conv2d_transpose(
         x,
         filters,
@@ -2,16 +2,18 @@
 
 
 from pixelcnn.gated_resnet import gated_resnet
-from pixelcnn.ops import down_shifted_conv2d
-from pixelcnn.ops import down_right_shifted_conv2d
+from pixelcnn.ops import initial_shifted_conv2d
+from pixelcnn.ops import concat_elu_down_shifted_conv2d
+from pixelcnn.ops import concat_elu_down_right_shifted_conv2d
+from pixelcnn.ops import concat_elu_down_shifted_sepconv2d
+from pixelcnn.ops import concat_elu_down_right_shifted_sepconv2d
 from pixelcnn.ops import down_shifted_conv2d_transpose
 from pixelcnn.ops import down_right_shifted_conv2d_transpose
-from pixelcnn.ops import down_shift
-from pixelcnn.ops import right_shift
 from pixelcnn.ops import concat_elu
+from pixelcnn.ops import OnesPad
+from pixelcnn.ops import EmbeddingWithBias
 from tensorflow.keras import layers
 from tensorflow.keras import models
-import tensorflow as tf
 
 
 def PixelCNN(
@@ -22,6 +24,7 @@ def PixelCNN(
         num_layers=6,
         filters=256,
         dropout_rate=0.1,
+        separable=False,
         **kwargs
 ):
     """Build a Pixel CNN model in Keras.
@@ -38,13 +41,16 @@ def PixelCNN(
 
     - filters: the number of filters iun each Conv2D layer.
     - dropout_rate: the fraction of units to drop.
+    - separable: a boolean that indicates whether the Gated Masked
+        Conv2D layers use depthwise separable convolutions.
 
     Returns:
     - model: a Keras model that accepts one tf.int32 tensor
         with shape [batch_dim, image_height, image_width]
     """
     if image_is_discrete:
-        images = layers.Input(shape=[image_height, image_width])
+        images = layers.Input(
+            shape=[image_height, image_width], dtype='int32')
     else:
         images = layers.Input(shape=[image_height, image_width, filters])
 
@@ -52,57 +58,47 @@ def PixelCNN(
     # Embed the discrete image pixels in a vector space #
     #####################################################
 
-    def padding_backend(z):
-        return tf.pad(
-            z,
-            [[0, 0], [0, 0], [0, 0], [0, 1]],
-            constant_values=1)
-
     if image_is_discrete:
-        images_embedding = layers.TimeDistributed(
-            layers.Embedding(output_size, filters))(images)
+        images_embedding = EmbeddingWithBias(
+            output_size, filters, name='image_embedding')(images)
     else:
-        images_embedding = images
-    images_embedding = layers.Lambda(padding_backend)(images_embedding)
+        images_embedding = OnesPad()(images)
 
     ##############################################
     # Prepare the image for shifted convolutions #
     ##############################################
 
-    top = down_shift(
-        down_shifted_conv2d(
-            images_embedding, filters, kernel_size=(2, 3)))
-
-    initial_top_left_stream_a = down_shift(
-        down_shifted_conv2d(
-            images_embedding, filters, kernel_size=(1, 3)))
-    initial_top_left_stream_b = right_shift(
-        down_right_shifted_conv2d(
-            images_embedding, filters, kernel_size=(2, 1)))
-    top_left = layers.add([
-        initial_top_left_stream_a, initial_top_left_stream_b])
+    top, top_left = initial_shifted_conv2d(
+        images_embedding, filters, name='initial_conv')
 
     ###################################################
     # Process with Residual Gated Masked Convolutions #
     ###################################################
 
+    if separable:
+        top_conv2d = concat_elu_down_shifted_sepconv2d
+        top_left_conv2d = concat_elu_down_right_shifted_sepconv2d
+    else:
+        top_conv2d = concat_elu_down_shifted_conv2d
+        top_left_conv2d = concat_elu_down_right_shifted_conv2d
+
     for layer in range(num_layers):
 
         top = gated_resnet(
             top,
-            conv2d=down_shifted_conv2d,
-            nonlinearity=concat_elu,
+            conv2d=top_conv2d,
             kernel_size=(2, 3),
             dropout_rate=dropout_rate,
+            name='top_{}'.format(layer),
             **kwargs)
 
         top_left = gated_resnet(
             top_left,
             a=top,
-            conv2d=down_right_shifted_conv2d,
-            nonlinearity=concat_elu,
+            conv2d=top_left_conv2d,
             kernel_size=(2, 2),
             dropout_rate=dropout_rate,
+            name='top_left_{}'.format(layer),
             **kwargs)
 
     #################################################
@@ -116,6 +112,8 @@ def PixelCNN(
         strides=(1, 1),
         padding='valid',
         data_format='channels_last',
+        dtype='float32',
+        name='logits',
         **kwargs)(top_left)
 
     return models.Model(inputs=[images], outputs=logits)
@@ -131,10 +129,12 @@ def ConditionalPixelCNN(
         conditional_width=1,
         class_conditional=True,
         num_classes=None,
+        class_embedding_lookup=False,
         num_preprocess_layers=5,
         num_layers=6,
         filters=256,
         dropout_rate=0.1,
+        separable=False,
         **kwargs
 ):
     """Build a Conditional Pixel CNN model in Keras.
@@ -155,6 +155,9 @@ def ConditionalPixelCNN(
         the conditional inputs are class labels.
     - num_classes: an integer that determines the number
         of unique classes to condition on.
+    - class_embedding_lookup: a boolean that indicates whether
+        class labels with a 1x1 conditional input are embedded
+        directly at the image size instead of upsampled.
 
     - num_preprocess_layers: the number of Conv2DTranspose layers
         for upsampling the conditional input.
@@ -162,6 +165,8 @@ def ConditionalPixelCNN(
 
     - filters: the number of filters iun each Conv2D layer.
     - dropout_rate: the fraction of units to drop.
+    - separable: a boolean that indicates whether the Gated Masked
+        Conv2D layers use depthwise separable convolutions.
 
     Returns:
     - model: a Keras model that accepts one tf.int32 tensor
@@ -170,11 +175,13 @@ def ConditionalPixelCNN(
             conditional_width, conditional_vector_size]
     """
     if image_is_discrete:
-        images = layers.Input(shape=[image_height, image_width])
+        images = layers.Input(
+            shape=[image_height, image_width], dtype='int32')
     else:
         images = layers.Input(shape=[image_height, image_width, filters])
     if class_conditional:
-        inputs = layers.Input(shape=[conditional_height, conditional_width])
+        inputs = layers.Input(
+            shape=[conditional_height, conditional_width], dtype='int32')
     else:
         inputs = layers.Input(shape=[
             conditional_height, conditional_width, conditional_vector_size])
@@ -184,79 +191,84 @@ def ConditionalPixelCNN(
     #####################################################
 
     conditional_embedding = inputs
-    if class_conditional:
+    if (class_embedding_lookup and class_conditional and
+            conditional_height == 1 and conditional_width == 1):
+
+        # the upsampled features depend only on the class label, so a
+        # lookup table replaces the Conv2DTranspose stack
         conditional_embedding = layers.TimeDistributed(
             layers.Embedding(
-                num_classes, conditional_vector_size))(conditional_embedding)
-
-    for i in range(num_preprocess_layers):
-        if i > 0:
-            conditional_embedding = concat_elu(conditional_embedding)
-        conditional_embedding = layers.Conv2DTranspose(
-            filters,
-            (5, 5),
-            strides=(2, 2),
-            padding='same',
-            data_format='channels_last',
-            **kwargs)(conditional_embedding)
+                num_classes,
+                image_height * image_width * filters))(conditional_embedding)
+        conditional_embedding = layers.Reshape([
+            image_height, image_width, filters])(conditional_embedding)
+
+    else:
+
+        if class_conditional:
+            conditional_embedding = layers.TimeDistributed(
+                layers.Embedding(
+                    num_classes,
+                    conditional_vector_size))(conditional_embedding)
+
+        for i in range(num_preprocess_layers):
+            if i > 0:
+                conditional_embedding = concat_elu(conditional_embedding)
+            conditional_embedding = layers.Conv2DTranspose(
+                filters,
+                (5, 5),
+                strides=(2, 2),
+                padding='same',
+                data_format='channels_last',
+                **kwargs)(conditional_embedding)
 
     #####################################################
     # Embed the discrete image pixels in a vector space #
     #####################################################
 
-    def padding_backend(z):
-        return tf.pad(
-            z,
-            [[0, 0], [0, 0], [0, 0], [0, 1]],
-            constant_values=1)
-
     if image_is_discrete:
-        images_embedding = layers.TimeDistributed(
-            layers.Embedding(output_size, filters))(images)
+        images_embedding = EmbeddingWithBias(
+            output_size, filters, name='image_embedding')(images)
     else:
-        images_embedding = images
-    images_embedding = layers.Lambda(padding_backend)(images_embedding)
+        images_embedding = OnesPad()(images)
 
     ##############################################
     # Prepare the image for shifted convolutions #
     ##############################################
 
-    top = down_shift(
-        down_shifted_conv2d(
-            images_embedding, filters, kernel_size=(2, 3)))
-
-    initial_top_left_stream_a = down_shift(
-        down_shifted_conv2d(
-            images_embedding, filters, kernel_size=(1, 3)))
-    initial_top_left_stream_b = right_shift(
-        down_right_shifted_conv2d(
-            images_embedding, filters, kernel_size=(2, 1)))
-    top_left = layers.add([
-        initial_top_left_stream_a, initial_top_left_stream_b])
+    top, top_left = initial_shifted_conv2d(
+        images_embedding, filters, name='initial_conv')
 
     ###################################################
     # Process with Residual Gated Masked Convolutions #
     ###################################################
 
+    if separable:
+        top_conv2d = concat_elu_down_shifted_sepconv2d
+        top_left_conv2d = concat_elu_down_right_shifted_sepconv2d
+    else:
+        top_conv2d = concat_elu_down_shifted_conv2d
+        top_left_conv2d = concat_elu_down_right_shifted_conv2d
+
     for layer in range(num_layers):
 
         top = gated_resnet(
             top,
             h=conditional_embedding,
-            conv2d=down_shifted_conv2d,
-            nonlinearity=concat_elu,
+            conv2d=top_conv2d,
             kernel_size=(2, 3),
             dropout_rate=dropout_rate,
+            name='top_{}'.format(layer),
             **kwargs)
 
         top_left = gated_resnet(
             top_left,
             a=top,
             h=conditional_embedding,
-            conv2d=down_right_shifted_conv2d,
-            nonlinearity=concat_elu,
+            conv2d=top_left_conv2d,
             kernel_size=(2, 2),
             dropout_rate=dropout_rate,
+            name='top_left_{}'.format(layer),
             **kwargs)
 
     #################################################
@@ -270,6 +282,8 @@ def ConditionalPixelCNN(
         strides=(1, 1),
         padding='valid',
         data_format='channels_last',
+        dtype='float32',
+        name='logits',
         **kwargs)(top_left)
 
     return models.Model(inputs=[images, inputs], outputs=logits)
@@ -4,14 +4,16 @@
 from pixelcnn.gated_resnet import gated_resnet
 from pixelcnn.ops import down_shifted_conv2d
 from pixelcnn.ops import down_right_shifted_conv2d
+from pixelcnn.ops import initial_shifted_conv2d
+from pixelcnn.ops import concat_elu_down_shifted_conv2d
+from pixelcnn.ops import concat_elu_down_right_shifted_conv2d
 from pixelcnn.ops import down_shifted_conv2d_transpose
 from pixelcnn.ops import down_right_shifted_conv2d_transpose
-from pixelcnn.ops import down_shift
-from pixelcnn.ops import right_shift
 from pixelcnn.ops import concat_elu
+from pixelcnn.ops import OnesPad
+from pixelcnn.ops import EmbeddingWithBias
 from tensorflow.keras import layers
 from tensorflow.keras import models
-import tensorflow as tf
 
 
 def PixelCNNPlusPlus(
@@ -47,7 +49,8 @@ def PixelCNNPlusPlus(
         with shape [batch_dim, image_height, image_width]
     """
     if image_is_discrete:
-        images = layers.Input(shape=[image_height, image_width])
+        images = layers.Input(
+            shape=[image_height, image_width], dtype='int32')
     else:
         images = layers.Input(shape=[image_height, image_width, filters])
 
@@ -55,35 +58,19 @@ def PixelCNNPlusPlus(
     # Embed the discrete image pixels in a vector space #
     #####################################################
 
-    def padding_backend(z):
-        return tf.pad(
-            z,
-            [[0, 0], [0, 0], [0, 0], [0, 1]],
-            constant_values=1)
-
     if image_is_discrete:
-        images_embedding = layers.TimeDistributed(
-            layers.Embedding(output_size, filters))(images)
+        images_embedding = EmbeddingWithBias(output_size, filters)(images)
     else:
-        images_embedding = images
-    images_embedding = layers.Lambda(padding_backend)(images_embedding)
+        images_embedding = OnesPad()(images)
 
     ##############################################
     # Prepare the image for shifted convolutions #
     ##############################################
 
-    top_streams = [down_shift(
-        down_shifted_conv2d(
-            images_embedding, filters, kernel_size=(2, 3)))]
-
-    initial_top_left_stream_a = down_shift(
-        down_shifted_conv2d(
-            images_embedding, filters, kernel_size=(1, 3)))
-    initial_top_left_stream_b = right_shift(
-        down_right_shifted_conv2d(
-            images_embedding, filters, kernel_size=(2, 1)))
-    top_left_streams = [
-        layers.add([initial_top_left_stream_a, initial_top_left_stream_b])]
+    initial_top_stream, initial_top_left_stream = initial_shifted_conv2d(
+        images_embedding, filters)
+    top_streams = [initial_top_stream]
+    top_left_streams = [initial_top_left_stream]
 
     ######################################################
     # Downsample with Residual Gated Masked Convolutions #
@@ -95,8 +82,7 @@ def PixelCNNPlusPlus(
 
             top_streams.append(gated_resnet(
                 top_streams[-1],
-                conv2d=down_shifted_conv2d,
-                nonlinearity=concat_elu,
+                conv2d=concat_elu_down_shifted_conv2d,
                 kernel_size=(2, 3),
                 dropout_rate=dropout_rate,
                 **kwargs))
@@ -104,8 +90,7 @@ def PixelCNNPlusPlus(
             top_left_streams.append(gated_resnet(
                 top_left_streams[-1],
                 a=top_streams[-1],
-                conv2d=down_right_shifted_conv2d,
-                nonlinearity=concat_elu,
+                conv2d=concat_elu_down_right_shifted_conv2d,
                 kernel_size=(2, 2),
                 dropout_rate=dropout_rate,
                 **kwargs))
@@ -156,8 +141,7 @@ def PixelCNNPlusPlus(
             top = gated_resnet(
                 top,
                 a=top_streams.pop(),
-                conv2d=down_shifted_conv2d,
-                nonlinearity=concat_elu,
+                conv2d=concat_elu_down_shifted_conv2d,
                 kernel_size=(2, 3),
                 dropout_rate=dropout_rate,
                 **kwargs)
@@ -165,8 +149,7 @@ def PixelCNNPlusPlus(
             top_left = gated_resnet(
                 top_left,
                 a=layers.concatenate([top, top_left_streams.pop()]),
-                conv2d=down_right_shifted_conv2d,
-                nonlinearity=concat_elu,
+                conv2d=concat_elu_down_right_shifted_conv2d,
                 kernel_size=(2, 2),
                 dropout_rate=dropout_rate,
                 **kwargs)
@@ -182,6 +165,7 @@ def PixelCNNPlusPlus(
         strides=(1, 1),
         padding='valid',
         data_format='channels_last',
+        dtype='float32',
         **kwargs)(top_left)
 
     return models.Model(inputs=[images], outputs=logits)
@@ -239,11 +223,13 @@ def ConditionalPixelCNNPlusPlus(
             conditional_width, conditional_vector_size]
     """
     if image_is_discrete:
-        images = layers.Input(shape=[image_height, image_width])
+        images = layers.Input(
+            shape=[image_height, image_width], dtype='int32')
     else:
         images = layers.Input(shape=[image_height, image_width, filters])
     if class_conditional:
-        inputs = layers.Input(shape=[conditional_height, conditional_width])
+        inputs = layers.Input(
+            shape=[conditional_height, conditional_width], dtype='int32')
     else:
         inputs = layers.Input(shape=[
             conditional_height, conditional_width, conditional_vector_size])
@@ -274,36 +260,19 @@ def ConditionalPixelCNNPlusPlus(
     # Embed the discrete image pixels in a vector space #
     #####################################################
 
-    def padding_backend(z):
-        return tf.pad(
-            z,
-            [[0, 0], [0, 0], [0, 0], [0, 1]],
-            constant_values=1)
-
     if image_is_discrete:
-        images_embedding = layers.TimeDistributed(
-            layers.Embedding(output_size, filters))(images)
+        images_embedding = EmbeddingWithBias(output_size, filters)(images)
     else:
-        images_embedding = images
-    images_embedding = layers.Lambda(padding_backend)(images_embedding)
+        images_embedding = OnesPad()(images)
 
     ##############################################
     # Prepare the image for shifted convolutions #
     ##############################################
 
-    top_streams = [down_shift(
-        down_shifted_conv2d(
-            images_embedding, filters, kernel_size=(2, 3)))]
-
-    initial_top_left_stream_a = down_shift(
-        down_shifted_conv2d(
-            images_embedding, filters, kernel_size=(1, 3)))
-    initial_top_left_stream_b = right_shift(
-        down_right_shifted_conv2d(
-            images_embedding, filters, kernel_size=(2, 1)))
-    top_left_streams = [
-        layers.add([
-            initial_top_left_stream_a, initial_top_left_stream_b])]
+    initial_top_stream, initial_top_left_stream = initial_shifted_conv2d(
+        images_embedding, filters)
+    top_streams = [initial_top_stream]
+    top_left_streams = [initial_top_left_stream]
 
     ######################################################
     # Downsample with Residual Gated Masked Convolutions #
@@ -316,8 +285,7 @@ def ConditionalPixelCNNPlusPlus(
             top_streams.append(gated_resnet(
                 top_streams[-1],
                 h=conditional_embedding[-(block + 1)],
-                conv2d=down_shifted_conv2d,
-                nonlinearity=concat_elu,
+                conv2d=concat_elu_down_shifted_conv2d,
                 kernel_size=(2, 3),
                 dropout_rate=dropout_rate,
                 **kwargs))
@@ -326,8 +294,7 @@ def ConditionalPixelCNNPlusPlus(
                 top_left_streams[-1],
                 a=top_streams[-1],
                 h=conditional_embedding[-(block + 1)],
-                conv2d=down_right_shifted_conv2d,
-                nonlinearity=concat_elu,
+                conv2d=concat_elu_down_right_shifted_conv2d,
                 kernel_size=(2, 2),
                 dropout_rate=dropout_rate,
                 **kwargs))
@@ -379,8 +346,7 @@ def ConditionalPixelCNNPlusPlus(
                 top,
                 a=top_streams.pop(),
                 h=conditional_embedding[-(block + 1)],
-                conv2d=down_shifted_conv2d,
-                nonlinearity=concat_elu,
+                conv2d=concat_elu_down_shifted_conv2d,
                 kernel_size=(2, 3),
                 dropout_rate=dropout_rate,
                 **kwargs)
@@ -389,8 +355,7 @@ def ConditionalPixelCNNPlusPlus(
                 top_left,
                 a=layers.concatenate([top, top_left_streams.pop()]),
                 h=conditional_embedding[-(block + 1)],
-                conv2d=down_right_shifted_conv2d,
-                nonlinearity=concat_elu,
+                conv2d=concat_elu_down_right_shifted_conv2d,
                 kernel_size=(2, 2),
                 dropout_rate=dropout_rate,
                 **kwargs)
@@ -406,6 +371,7 @@ def ConditionalPixelCNNPlusPlus(
         strides=(1, 1),
         padding='valid',
         data_format='channels_last',
+        dtype='float32',
         **kwargs)(top_left)
 
     return models.Model(inputs=[images, inputs], outputs=logits)
@@ -0,0 +1,433 @@
+"""Author: Brandon Trabucco, Copyright 2020, MIT License"""
+
+
+from pixelcnn.ops import concat_elu_backend
+from pixelcnn.ops import ConcatEluConv2D
+from tensorflow.keras import layers
+import tensorflow as tf
+
+
+class CachedDownShiftedConv2D(layers.Layer):
+    """Apply a trained down shifted Conv2D one image row at a time,
+    caching the input rows above the current row."""
+
+    def __init__(
+            self,
+            conv,
+            **kwargs
+    ):
+        """Wrap a trained down shifted layer for row by row inference.
+
+        Args:
+        - conv: a ConcatEluConv2D layer with shift='down'
+        """
+        # compute in the dtype of the trained layer, not the global policy
+        kwargs.setdefault('dtype', conv.dtype_policy)
+        super(CachedDownShiftedConv2D, self).__init__(**kwargs)
+        self.conv = conv
+        self.dy = conv.conv.kernel_size[0]
+
+    def initial_cache(self, batch_size, width, channels):
+        """Create an empty cache for the rows above the first row.
+
+        Args:
+        - batch_size: the number of images being generated.
+        - width: the width of the images being generated.
+        - channels: the number of channels of the layer input.
+
+        Returns:
+        - cache: a 4-Tensor with shape [batch_dim, dy - 1, width, channels]
+        """
+        return tf.zeros([
+            batch_size, self.dy - 1, width, channels],
+            dtype=self.conv.compute_dtype)
+
+    def call(self, x, cache):
+        """Compute the output row for a new input row.
+
+        Args:
+        - x: a 4-Tensor with shape [batch_dim, 1, width, channels]
+        - cache: a 4-Tensor with shape [batch_dim, dy - 1, width, channels]
+
+        Returns:
+        - out_x: a 4-Tensor with shape [batch_dim, 1, width, filters]
+        - cache: a 4-Tensor with shape [batch_dim, dy - 1, width, channels]
+        """
+        rows = tf.concat([cache, x], 1)
+        out_x = self.conv(rows, training=False)[:, (self.dy - 1):]
+        return out_x, rows[:, 1:]
+
+
+class CachedDownRightShiftedConv2D(layers.Layer):
+    """Apply a trained down and right shifted Conv2D one pixel at a time,
+    caching the input rows above and the input pixels to the left."""
+
+    def __init__(
+            self,
+            conv,
+            **kwargs
+    ):
+        """Wrap a trained down and right shifted layer for pixel by
+        pixel inference.
+
+        Args:
+        - conv: a ConcatEluConv2D layer with shift='down_right'
+        """
+        # compute in the dtype of the trained layer, not the global policy
+        kwargs.setdefault('dtype', conv.dtype_policy)
+        super(CachedDownRightShiftedConv2D, self).__init__(**kwargs)
+        self.conv = conv
+        self.dy, self.dx = conv.conv.kernel_size
+
+    def initial_cache(self, batch_size, width, channels):
+        """Create an empty cache for the first image row.
+
+        Args:
+        - batch_size: the number of images being generated.
+        - width: the width of the images being generated.
+        - channels: the number of channels of the layer input.
+
+        Returns:
+        - cache: a 4-Tensor with shape [batch_dim, dy,
+            width + dx - 1, channels]
+        """
+        return tf.zeros([
+            batch_size, self.dy, width + self.dx - 1, channels],
+            dtype=self.conv.compute_dtype)
+
+    def next_row(self, cache):
+        """Move the cache to the start of the next image row.
+
+        Args:
+        - cache: a 4-Tensor with shape [batch_dim, dy,
+            width + dx - 1, channels]
+
+        Returns:
+        - cache: a 4-Tensor with shape [batch_dim, dy,
+            width + dx - 1, channels]
+        """
+        return tf.concat([cache[:, 1:], tf.zeros_like(cache[:, :1])], 1)
+
+    def call(self, x, cache, column):
+        """Compute the output pixel for a new input pixel.
+
+        Args:
+        - x: a 4-Tensor with shape [batch_dim, 1, 1, channels]
+        - cache: a 4-Tensor with shape [batch_dim, dy,
+            width + dx - 1, channels]
+        - column: a scalar tf.int32 tensor, the column of x
+
+        Returns:
+        - out_x: a 4-Tensor with shape [batch_dim, 1, 1, filters]
+        - cache: a 4-Tensor with shape [batch_dim, dy,
+            width + dx - 1, channels]
+        """
+        mask = tf.reshape(tf.one_hot(
+            column + self.dx - 1, tf.shape(cache)[2], dtype=cache.dtype),
+            [1, 1, -1, 1])
+        cache = tf.concat([cache[:, :-1], (
+            cache[:, -1:] * (1.0 - mask) + x * mask)], 1)
+
+        window = tf.slice(
+            cache, [0, 0, column, 0], [-1, self.dy, self.dx, -1])
+        out_x = self.conv(window, training=False)[
+            :, (self.dy - 1):, (self.dx - 1):]
+        return out_x, cache
+
+
+class PixelCNNSampler(tf.Module):
+    """Generate images from a trained PixelCNN or ConditionalPixelCNN
+    while caching activations, so that each pixel only recomputes the
+    activations at its own location instead of the whole image."""
+
+    def __init__(self, model):
+        """Share the layers of a trained model for fast sampling.
+
+        Args:
+        - model: a Keras model built with PixelCNN or ConditionalPixelCNN
+            using image_is_discrete=True and separable=False
+        """
+        super(PixelCNNSampler, self).__init__()
+        self.model = model
+        self.image_height = int(model.inputs[0].shape[1])
+        self.image_width = int(model.inputs[0].shape[2])
+        self.conditional = len(model.inputs) > 1
+
+        layer_names = [layer.name for layer in model.layers]
+        if 'image_embedding' not in layer_names:
+            raise ValueError(
+                'model has no layer named image_embedding, only models '
+                'built with PixelCNN or ConditionalPixelCNN using '
+                'image_is_discrete=True can be sampled with a cache')
+
+        self.image_embedding = model.get_layer('image_embedding')
+        self.initial_conv = model.get_layer('initial_conv')
+        self.logits = model.get_layer('logits')
+        self.filters = int(self.initial_conv.filters) // 3
+
+        self.top_blocks = []
+        self.top_left_blocks = []
+        while 'top_{}_conv_1'.format(len(self.top_blocks)) in layer_names:
+            self.top_blocks.append(self.get_block(
+                'top_{}'.format(len(self.top_blocks)),
+                CachedDownShiftedConv2D))
+            self.top_left_blocks.append(self.get_block(
+                'top_left_{}'.format(len(self.top_left_blocks)),
+                CachedDownRightShiftedConv2D))
+
+        if self.conditional:
+            self.conditional_embedding = tf.keras.Model(
+                inputs=model.inputs[1],
+                outputs=model.get_layer('top_0_conv_h').input)
+
+    def get_block(self, name, cached_conv2d):
+        """Collect the layers of one trained gated_resnet module.
+
+        Args:
+        - name: the name prefix of the gated_resnet module.
+        - cached_conv2d: the cached layer class that wraps the
+            shifted convolutions of the module.
+
+        Returns:
+        - block: a dict of the cached and 1x1 layers in the module
+        """
+        layer_names = [layer.name for layer in self.model.layers]
+
+        def get_layer(suffix):
+            layer_name = '{}_{}'.format(name, suffix)
+            if layer_name not in layer_names:
+                return None
+            layer = self.model.get_layer(layer_name)
+            if not isinstance(layer, ConcatEluConv2D):
+                raise ValueError(
+                    'layer {} is not a ConcatEluConv2D, separable models '
+                    'cannot be sampled with a cache'.format(layer_name))
+            return layer
+
+        return dict(
+            conv_1=cached_conv2d(get_layer('conv_1')),
+            conv_a=get_layer('conv_a'),
+            conv_2=cached_conv2d(get_layer('conv_2')),
+            conv_h=get_layer('conv_h'))
+
+    def initial_state(self, batch_size, conditional_embedding=None):
+        """Create the caches for an empty batch of images.
+
+        Args:
+        - batch_size: the number of images being generated.
+        - conditional_embedding: a 4-Tensor with shape [batch_dim,
+            image_height, image_width, filters] or None
+
+        Returns:
+        - state: a nested structure of cached tensors
+        """
+        dtype = self.initial_conv.compute_dtype
+        state = dict(
+            images=tf.zeros([
+                batch_size, 2, self.image_width + 2, self.filters + 1],
+                dtype=dtype),
+            top_rows=[tf.zeros([
+                batch_size, 1, self.image_width, self.filters],
+                dtype=dtype)] * len(self.top_blocks),
+            top_left_row=tf.zeros([
+                batch_size, 1, self.image_width, self.filters],
+                dtype=dtype),
+            top_caches=[],
+            top_left_caches=[])
+
+        for block in self.top_blocks:
+            state['top_caches'].append([
+                block['conv_1'].initial_cache(
+                    batch_size, self.image_width, self.filters),
+                block['conv_2'].initial_cache(
+                    batch_size, self.image_width, self.filters)])
+
+        for block in self.top_left_blocks:
+            state['top_left_caches'].append([
+                block['conv_1'].initial_cache(
+                    batch_size, self.image_width, self.filters),
+                block['conv_2'].initial_cache(
+                    batch_size, self.image_width, self.filters)])
+
+        if conditional_embedding is not None:
+            state['conditional_embedding'] = tf.cast(
+                conditional_embedding, dtype)
+        return state
+
+    def gated_resnet(self, x, block, caches, a=None, h=None, column=None):
+        """Apply a trained gated_resnet module using cached inputs.
+
+        Args:
+        - x: a 4-Tensor with the new inputs to the module
+        - block: a dict of the cached and 1x1 layers in the module
+        - caches: a list of the caches of both shifted convolutions
+        - a: a 4-Tensor with features from earlier hierarchies or None
+        - h: a 4-Tensor that conditions image generation or None
+        - column: a scalar tf.int32 tensor, or None for a full row
+
+        Returns:
+        - out_x: a 4-Tensor with the same shape as x
+        - caches: a list of the caches of both shifted convolutions
+        """
+        args = [] if column is None else [column]
+
+        c, cache_1 = block['conv_1'](x, caches[0], *args)
+        if a is not None:
+            c = c + block['conv_a'](a, training=False)
+
+        c, cache_2 = block['conv_2'](c, caches[1], *args)
+        if h is not None:
+            c = c + block['conv_h'](h, training=False)
+
+        c_a, c_b = tf.split(c, 2, axis=3)
+        return x + c_a * tf.math.sigmoid(c_b), [cache_1, cache_2]
+
+    @tf.function
+    def row_step(self, state, row):
+        """Compute the top stream for a new row of the image.
+
+        Args:
+        - state: a nested structure of cached tensors whose images
+            hold the two rows above the new row
+        - row: a scalar tf.int32 tensor, the index of the new row
+
+        Returns:
+        - state: a nested structure of cached tensors whose images
+            hold the row above the new row and an empty new row
+        """
+        state = dict(state)
+        x = self.initial_conv(state['images'])
+        top, top_left, _ = tf.split(x, 3, axis=3)
+
+        # the first row only sees the zero padding above the image
+        is_valid = tf.cast(row > 0, x.dtype)
+        top = top * is_valid
+        state['top_left_row'] = top_left * is_valid
+
+        h = None
+        if self.conditional:
+            h = state['conditional_embedding'][:, row:(row + 1)]
+
+        top_rows, top_caches = [], []
+        for block, caches in zip(self.top_blocks, state['top_caches']):
+            top, caches = self.gated_resnet(top, block, caches, h=h)
+            top_rows.append(top)
+            top_caches.append(caches)
+
+        state['top_rows'] = top_rows
+        state['top_caches'] = top_caches
+        state['top_left_caches'] = [[
+            block['conv_1'].next_row(caches[0]),
+            block['conv_2'].next_row(caches[1])] for block, caches in zip(
+                self.top_left_blocks, state['top_left_caches'])]
+        state['images'] = tf.concat([
+            state['images'][:, 1:],
+            tf.zeros_like(state['images'][:, :1])], 1)
+        return state
+
+    @tf.function
+    def pixel_step(self, state, row, column):
+        """Compute the logits of the next pixel in the current row.
+
+        Args:
+        - state: a nested structure of cached tensors
+        - row: a scalar tf.int32 tensor, the index of the current row
+        - column: a scalar tf.int32 tensor, the index of the next pixel
+
+        Returns:
+        - logits: a 2-Tensor with shape [batch_dim, output_size]
+        - state: a nested structure of cached tensors
+        """
+        state = dict(state)
+
+        # the down and right shifted part of the initial stream sees
+        # the pixels above and to the left of the next pixel
+        window = tf.slice(
+            state['images'],
+            [0, 0, tf.maximum(column - 1, 0), 0], [-1, 2, 3, -1])
+        top_left = self.initial_conv(window)[:, :, :, (2 * self.filters):]
+        top_left = top_left * tf.cast(column > 0, top_left.dtype)
+        top_left = top_left + state['top_left_row'][
+            :, :, column:(column + 1)]
+
+        h = None
+        if self.conditional:
+            h = state['conditional_embedding'][
+                :, row:(row + 1), column:(column + 1)]
+
+        top_left_caches = []
+        for block, caches, top in zip(
+                self.top_left_blocks,
+                state['top_left_caches'],
+                state['top_rows']):
+            top_left, caches = self.gated_resnet(
+                top_left,
+                block,
+                caches,
+                a=top[:, :, column:(column + 1)],
+                h=h,
+                column=column)
+            top_left_caches.append(caches)
+
+        state['top_left_caches'] = top_left_caches
+        logits = self.logits(concat_elu_backend(top_left))
+        return logits[:, 0, 0, :], state
+
+    @tf.function
+    def write_pixel(self, state, pixels, column):
+        """Write the chosen pixels into the current row of the cache.
+
+        Args:
+        - state: a nested structure of cached tensors
+        - pixels: a 1-Tensor of tf.int32 pixel ids with shape [batch_dim]
+        - column: a scalar tf.int32 tensor, the index of the pixels
+
+        Returns:
+        - state: a nested structure of cached tensors
+        """
+        state = dict(state)
+        images = state['images']
+        x = self.image_embedding(pixels[:, tf.newaxis, tf.newaxis])
+
+        mask = tf.reshape(tf.one_hot(
+            column + 1, tf.shape(images)[2], dtype=images.dtype),
+            [1, 1, -1, 1])
+        state['images'] = tf.concat([images[:, :1], (
+            images[:, 1:] * (1.0 - mask) + x * mask)], 1)
+        return state
+
+    def sample(self, inputs=None, batch_size=1):
+        """Generate a batch of images one pixel at a time.
+
+        Args:
+        - inputs: the conditional inputs of a ConditionalPixelCNN
+            with shape [batch_dim, conditional_height,
+            conditional_width] or None
+        - batch_size: the number of images to generate when the
+            model is not conditional.
+
+        Returns:
+        - images: a tf.int32 tensor with shape [batch_dim,
+            image_height, image_width]
+        """
+        conditional_embedding = None
+        if self.conditional:
+            conditional_embedding = self.conditional_embedding(inputs)
+            batch_size = int(conditional_embedding.shape[0])
+
+        state = self.initial_state(batch_size, conditional_embedding)
+        images = []
+
+        for row in range(self.image_height):
+            state = self.row_step(state, tf.constant(row))
+
+            for column in range(self.image_width):
+                logits, state = self.pixel_step(
+                    state, tf.constant(row), tf.constant(column))
+                pixels = tf.random.categorical(
+                    logits, 1, dtype=tf.int32)[:, 0]
+                state = self.write_pixel(state, pixels, tf.constant(column))
+                images.append(pixels)
+
+        return tf.reshape(tf.stack(images, axis=1), [
+            batch_size, self.image_height, self.image_width])
@@ -0,0 +1,80 @@
+"""Author: Brandon Trabucco, Copyright 2020, MIT License"""
+
+
+from pixelcnn import PixelCNNSampler
+import tensorflow as tf
+import matplotlib.pyplot as plt
+import sys
+
+
+def sample_uncached(model, inputs):
+    """Generate a batch of images by running the full model once
+    for every pixel, which works for any trained model.
+
+    Args:
+    - model: a Keras model that accepts images and class labels.
+    - inputs: a tf.int32 tensor of class labels with shape
+        [batch_dim, 1, 1]
+
+    Returns:
+    - images: a tf.int32 tensor with shape [batch_dim,
+        image_height, image_width]
+    """
+    image_height = int(model.inputs[0].shape[1])
+    image_width = int(model.inputs[0].shape[2])
+    batch_size = int(inputs.shape[0])
+
+    # trace the forward pass once so the loop skips the keras call path
+    forward = tf.function(
+        lambda images, labels: model([images, labels], training=False)
+    ).get_concrete_function(
+        tf.TensorSpec([batch_size, image_height, image_width], tf.int32),
+        tf.TensorSpec(inputs.shape, tf.int32))
+
+    images = tf.zeros([batch_size, image_height, image_width], tf.int32)
+    for row in range(image_height):
+        for column in range(image_width):
+            logits = forward(images, inputs)[:, row, column]
+            pixels = tf.random.categorical(logits, 1, dtype=tf.int32)
+            images = tf.tensor_scatter_nd_update(
+                images,
+                [[i, row, column] for i in range(batch_size)],
+                pixels[:, 0])
+
+    return images
+
+
+if __name__ == "__main__":
+
+    # models saved by train.py are PixelCNN++ models, which cannot be
+    # sampled with a cache, pass the path of a PixelCNN or
+    # ConditionalPixelCNN model to use the fast sampler
+    model_path = sys.argv[1] if len(sys.argv) > 1 else 'models/model.h5'
+    model = tf.keras.models.load_model(
+        model_path, custom_objects={'tf': tf})
+
+    labels = tf.range(10, dtype=tf.int32)[:, tf.newaxis, tf.newaxis]
+
+    try:
+        sampler = PixelCNNSampler(model)
+
+    except ValueError as error:
+
+        print("Sampling without a cache,", error)
+        sampler = None
+
+    if sampler is not None:
+        images = sampler.sample(inputs=labels)
+    else:
+        images = sample_uncached(model, labels)
+
+    r_channel = tf.cast(images % 10, tf.float32) / 9.0
+    g_channel = tf.cast((images // 10) % 10, tf.float32) / 9.0
+    b_channel = tf.cast((images // 100) % 10, tf.float32) / 9.0
+
+    images = tf.stack([r_channel, g_channel, b_channel], axis=3)
+
+    for i in range(10):
+        plt.imshow(images[i, :, :, :].numpy())
+        plt.show()
+        plt.clf()
@@ -0,0 +1,45 @@
+"""Author: Brandon Trabucco, Copyright 2020, MIT License"""
+
+
+from pixelcnn import ConditionalPixelCNNPlusPlus
+from pixelcnn.ops import EmbeddingWithBias
+import tensorflow as tf
+
+
+if __name__ == "__main__":
+
+    tf.keras.mixed_precision.set_global_policy('mixed_bfloat16')
+
+    model = ConditionalPixelCNNPlusPlus(
+        1000,
+        32,
+        image_height=32,
+        image_width=32,
+        conditional_height=1,
+        conditional_width=1,
+        num_preprocess_layers=5,
+        num_modules=1,
+        num_layers_per_module=1,
+        filters=16,
+        class_conditional=True,
+        num_classes=10)
+
+    embedding = [layer for layer in model.layers
+                 if isinstance(layer, EmbeddingWithBias)][0]
+    embedding_model = tf.keras.Model(
+        inputs=model.inputs, outputs=embedding.output)
+
+    # every pixel id appears once, bfloat16 would round ids above 256
+    images = tf.reshape(tf.range(1024, dtype=tf.int32) % 1000, [1, 32, 32])
+    labels = tf.zeros([1, 1, 1], dtype=tf.int32)
+
+    for jit_compile in [False, True]:
+        embeddings = tf.function(embedding_model, jit_compile=jit_compile)(
+            [images, labels])
+        embeddings = tf.reshape(
+            embeddings, [1024, embeddings.shape[-1]])[:1000]
+        num_unique = tf.shape(tf.raw_ops.UniqueV2(
+            x=tf.cast(embeddings, tf.float32), axis=[0])[0])[0]
+        assert int(num_unique) == 1000, int(num_unique)
+
+    print("All 1000 pixel ids have distinct embeddings")
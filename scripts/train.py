@@ -4,13 +4,104 @@
 from pixelcnn import ConditionalPixelCNNPlusPlus
 import tensorflow_datasets as tfds
 import tensorflow as tf
+import threading
+import atexit
 
 
-if __name__ == "__main__":
+def preprocess(example):
+    """Quantize and pack a CIFAR10 example into discrete pixel ids.
 
-    tf.io.gfile.makedirs("models")
+    Args:
+    - example: a dict with a uint8 "image" tensor with shape
+        [height, width, 3] and an int64 "label" tensor
+
+    Returns:
+    - images: a tf.int32 tensor with shape [height, width]
+    - labels: a tf.int32 tensor with shape [1, 1]
+    """
+    # floor(x / 25.6) == floor(x * 5 / 128), which stays in integers
+    images = tf.cast(example["image"], tf.int32) * 5 // 128
+
+    images = (images[:, :, 0] +
+              images[:, :, 1] * 10 +
+              images[:, :, 2] * 100)
+
+    labels = tf.cast(
+        example["label"], tf.int32)[tf.newaxis, tf.newaxis]
+
+    return images, labels
+
+
+def build_train_step(
+        model,
+        optimizer,
+        batch_size=32,
+        image_height=32,
+        image_width=32,
+        jit_compile=True
+):
+    """Build a compiled training step for a class conditional model.
+
+    Args:
+    - model: a Keras model that accepts images and class labels.
+    - optimizer: a Keras optimizer that updates the model weights.
+
+    - batch_size: the static number of examples in every batch.
+    - image_height: the height of the images in every batch.
+    - image_width: the width of the images in every batch.
+    - jit_compile: a boolean that indicates whether the step
+        should be compiled with XLA.
+
+    Returns:
+    - train_step: a tf.function that accepts a batch of packed images
+        and labels and returns the bits per dim
+    """
+    loss_scale = isinstance(
+        optimizer, tf.keras.mixed_precision.LossScaleOptimizer)
+
+    @tf.function(
+        input_signature=[
+            tf.TensorSpec(
+                [batch_size, image_height, image_width], tf.int32),
+            tf.TensorSpec([batch_size, 1, 1], tf.int32)],
+        jit_compile=jit_compile,
+        reduce_retracing=True)
+    def train_step(images, labels):
+
+        images = tf.ensure_shape(
+            images, [batch_size, image_height, image_width])
+        labels = tf.ensure_shape(labels, [batch_size, 1, 1])
+
+        with tf.GradientTape() as tape:
+
+            logits = model([images, labels], training=True)
+            bits_per_dim = tf.reduce_mean(
+                tf.nn.sparse_softmax_cross_entropy_with_logits(
+                    labels=tf.reshape(images, [-1]),
+                    logits=tf.reshape(
+                        logits, [-1, logits.shape[-1]]))) / tf.math.log(2.0)
+
+            loss = bits_per_dim
+            if loss_scale:
+                loss = optimizer.get_scaled_loss(loss)
+
+        grads = tape.gradient(loss, model.trainable_variables)
+        if loss_scale:
+            grads = optimizer.get_unscaled_gradients(grads)
+        optimizer.apply_gradients(zip(grads, model.trainable_variables))
+
+        return bits_per_dim
+
+    return train_step
 
-    model = ConditionalPixelCNNPlusPlus(
+
+def build_model():
+    """Build the class conditional PixelCNN++ that is trained on CIFAR10.
+
+    Returns:
+    - model: a Keras model that accepts images and class labels.
+    """
+    return ConditionalPixelCNNPlusPlus(
         1000,
         32,
         image_height=32,
@@ -25,35 +116,136 @@ if __name__ == "__main__":
         class_conditional=True,
         num_classes=10)
 
+
+def build_snapshot(model, optimizer):
+    """Build a float32 copy of a model and its optimizer that holds the
+    variables of one training step while they are written to disk.
+
+    Args:
+    - model: a Keras model built with build_model.
+    - optimizer: a Keras optimizer that updates the model weights
+        and has applied at least one update.
+
+    Returns:
+    - checkpoint: a tf.train.Checkpoint that tracks the copy
+    - take_snapshot: a function that copies the current variables
+        of the model and optimizer into the copy
+    """
+    # layers built with a float32 policy hold plain variables, which
+    # have the same checkpoint layout as the mixed precision model
+    policy = tf.keras.mixed_precision.global_policy()
+    tf.keras.mixed_precision.set_global_policy('float32')
+    snapshot_model = build_model()
+    tf.keras.mixed_precision.set_global_policy(policy)
+
+    snapshot_optimizer = tf.keras.optimizers.deserialize(
+        tf.keras.optimizers.serialize(optimizer))
+    snapshot_optimizer.build(snapshot_model.trainable_variables)
+
+    def get_variables(*trackables):
+        return [x for trackable in trackables
+                for x in tf.train.TrackableView(trackable).descendants()
+                if isinstance(x, tf.Variable)]
+
+    # the walk also finds optimizer state outside optimizer.variables,
+    # such as the loss scale of a LossScaleOptimizer
+    variables = get_variables(model, optimizer)
+    snapshot_variables = get_variables(snapshot_model, snapshot_optimizer)
+
+    def take_snapshot():
+        for x, snapshot_x in zip(variables, snapshot_variables):
+            snapshot_x.assign(x)
+
+    return tf.train.Checkpoint(
+        model=snapshot_model, optimizer=snapshot_optimizer), take_snapshot
+
+
+if __name__ == "__main__":
+
+    tf.io.gfile.makedirs("models")
+
+    # the train step is compiled with XLA explicitly, so auto-clustering
+    # is only turned on if that compilation fails
+    tf.config.optimizer.set_jit(False)
+    batch_size = 32
+
+    # run the convolutions in bfloat16 while keeping the weights
+    # and the final logits in float32, the models stay channels_last
+    # because that is the native tensor core layout for 16 bit convs
+    tf.keras.mixed_precision.set_global_policy('mixed_bfloat16')
+
+    model = build_model()
+
     optimizer = tf.keras.optimizers.Adam()
+    if tf.keras.mixed_precision.global_policy().name == 'mixed_float16':
+        optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
 
-    train_ds = tfds.load("cifar10", split="train")
-    train_ds = train_ds.shuffle(1024).batch(32).repeat(5)
-    train_ds = train_ds.prefetch(10)
+    manager = None
+    save_threads = []
 
-    for i, example in enumerate(train_ds):
+    def save_model():
+        for thread in save_threads:
+            thread.join()
+        model.save('models/model.h5')
 
-        images = tf.cast(tf.cast(
-            example["image"], tf.float32) / 25.6, tf.int32)
+    atexit.register(save_model)
 
-        images = (images[:, :, :, 0] +
-                  images[:, :, :, 1] * 10 +
-                  images[:, :, :, 2] * 100)
+    train_ds = tfds.load("cifar10", split="train")
+    train_ds = train_ds.map(
+        preprocess, num_parallel_calls=tf.data.AUTOTUNE).cache()
+    train_ds = train_ds.shuffle(1024).batch(
+        batch_size, drop_remainder=True).repeat(5)
+    train_ds = train_ds.prefetch(tf.data.AUTOTUNE)
 
-        labels = tf.cast(
-            example["label"], tf.int32)[:, tf.newaxis, tf.newaxis]
+    train_step = build_train_step(
+        model, optimizer, batch_size=batch_size, jit_compile=True)
 
-        def loss_function():
+    writer = tf.summary.create_file_writer('logs')
+    running_bits_per_dim = tf.keras.metrics.Mean()
 
-            bits_per_dim = tf.reduce_mean(
-                tf.keras.losses.sparse_categorical_crossentropy(
-                    images, model([images, labels]), from_logits=True))
+    for i, (images, labels) in enumerate(train_ds):
+
+        try:
+            bits_per_dim = train_step(images, labels)
 
-            tf.print("Iteration:", i, "Bits Per Dim:", bits_per_dim)
+        except (tf.errors.InvalidArgumentError,
+                tf.errors.UnimplementedError):
 
-            return bits_per_dim
+            if i > 0:
+                raise
 
-        optimizer.minimize(loss_function, model.trainable_variables)
+            # not every op in the model lowers to XLA, so fall back
+            # to a graph function and let auto-clustering fuse what it can
+            tf.config.optimizer.set_jit(True)
+            train_step = build_train_step(
+                model, optimizer, batch_size=batch_size, jit_compile=False)
+            bits_per_dim = train_step(images, labels)
+
+        # accumulate on device and only read the loss back to the host
+        # every 100 steps, so the step queue is never drained
+        running_bits_per_dim.update_state(bits_per_dim)
 
         if i % 100 == 0:
-            model.save('models/model.h5')
+
+            with writer.as_default():
+                tf.summary.scalar(
+                    'bits_per_dim', running_bits_per_dim.result(), step=i)
+
+            print("Iteration:", i, "Bits Per Dim:",
+                  float(running_bits_per_dim.result()))
+            running_bits_per_dim.reset_state()
+
+            if manager is None:
+                checkpoint, take_snapshot = build_snapshot(model, optimizer)
+                manager = tf.train.CheckpointManager(
+                    checkpoint, 'models/ckpts', max_to_keep=3)
+
+            # write only the variables, and off the main thread, so the
+            # next training steps do not wait on disk, the variables are
+            # copied first so the checkpoint is from a single step
+            for thread in save_threads:
+                thread.join()
+            take_snapshot()
+            save_threads[:] = [threading.Thread(
+                target=manager.save, daemon=True)]
+            save_threads[0].start()